@@ -0,0 +1,130 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.settings import RECIPE_CACHE_TIMEOUT
+from recipes.models import Recipe
+from users.models import Subscription
+
+VERSION_KEY = 'recipe-version:{}'
+DATA_KEY = 'recipe-data:{}:{}'
+
+
+def get_recipe_versions(pks):
+    """Return the current cache version of every recipe in ``pks``.
+
+    A recipe without a version gets a fresh one, so data cached under
+    an older version can never be served again.
+    """
+    keys = {pk: VERSION_KEY.format(pk) for pk in pks}
+    found = cache.get_many(keys.values())
+    missing = {
+        key: uuid4().hex for key in keys.values() if key not in found
+    }
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {pk: found[key] for pk, key in keys.items()}
+
+
+def invalidate_recipes(pks):
+    """Drop the cached representations once the transaction commits."""
+    keys = [VERSION_KEY.format(pk) for pk in set(pks)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_shared_representations(recipes, serializer):
+    """Return the viewer-independent part of each recipe.
+
+    Cache misses are loaded in one batch and rendered as an anonymous
+    viewer would see them. They are rendered without a request, so the
+    media URLs stay relative to whatever host serves them.
+    """
+    versions = get_recipe_versions([recipe.pk for recipe in recipes])
+    keys = {pk: DATA_KEY.format(pk, version)
+            for pk, version in versions.items()}
+    found = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in found]
+    if missing:
+        shared_serializer = type(serializer)(context={})
+        fresh = {
+            keys[recipe.pk]: shared_serializer.to_shared_representation(
+                recipe
+            )
+            for recipe in Recipe.objects.for_read(None).filter(
+                pk__in=missing
+            )
+        }
+        cache.set_many(fresh, RECIPE_CACHE_TIMEOUT)
+        found.update(fresh)
+    return [found.get(keys[recipe.pk]) for recipe in recipes]
+
+
+class SubscriptionResolver:
+    """Per-request answers to "does the viewer follow this author?".
+
+    Authors are resolved in batches and every answer is kept, so a
+    response embedding many users costs one query per batch.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.checked = set()
+        self.followed = set()
+
+    def prefetch(self, author_ids):
+        missing = set(author_ids) - self.checked
+        if missing and self.user.is_authenticated:
+            self.followed.update(Subscription.objects.filter(
+                user=self.user, author_id__in=missing
+            ).values_list('author_id', flat=True))
+        self.checked.update(missing)
+
+    def is_subscribed(self, author_id):
+        self.prefetch([author_id])
+        return author_id in self.followed
+
+
+def get_subscription_resolver(context):
+    if 'subscriptions' not in context:
+        context['subscriptions'] = SubscriptionResolver(
+            context.get('request').user
+        )
+    return context['subscriptions']
+
+
+def build_media_urls(data, request):
+    if data['image']:
+        data['image'] = request.build_absolute_uri(data['image'])
+    data['image_variants'] = {
+        variant: request.build_absolute_uri(url)
+        for variant, url in data['image_variants'].items()
+    }
+
+
+def render_recipes(recipes, serializer):
+    """Render recipes from the cache and overlay the viewer's flags
+    and the absolute media URLs of the request."""
+    request = serializer.context.get('request')
+    subscriptions = get_subscription_resolver(serializer.context)
+    subscriptions.prefetch(recipe.author_id for recipe in recipes)
+    representations = []
+    shared = get_shared_representations(recipes, serializer)
+    for recipe, data in zip(recipes, shared):
+        if data is None:
+            continue
+        data = dict(data)
+        if request is not None:
+            build_media_urls(data, request)
+        data['author'] = dict(
+            data['author'],
+            is_subscribed=subscriptions.is_subscribed(recipe.author_id)
+        )
+        data['is_favorited'] = serializer.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = serializer.get_is_in_shopping_cart(
+            recipe
+        )
+        representations.append(data)
+    return representations
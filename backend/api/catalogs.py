@@ -0,0 +1,64 @@
+import gzip
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import IngredientSerializer, TagSerializer
+from recipes.models import Ingredient, Tag
+from recipes.snapshots import INGREDIENTS, TAGS, CatalogSnapshot
+
+
+class RenderedCatalog:
+    """Full catalog response rendered once, with a gzip variant."""
+
+    def __init__(self, content):
+        self.content = content
+        self.gzipped = gzip.compress(content)
+        self.etag = quote_etag(hashlib.sha1(content).hexdigest())
+
+    def response(self, request):
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if 'gzip' not in accept_encoding:
+            return HttpResponse(self.content, content_type='application/json')
+        response = HttpResponse(self.gzipped, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        return response
+
+
+class RenderedCatalogSnapshot(CatalogSnapshot):
+    queryset = None
+    serializer_class = None
+
+    def build(self):
+        data = self.serializer_class(self.queryset.all(), many=True).data
+        return RenderedCatalog(JSONRenderer().render(data))
+
+
+class IngredientCatalog(RenderedCatalogSnapshot):
+    catalog = INGREDIENTS
+    queryset = Ingredient.objects.all()
+    serializer_class = IngredientSerializer
+
+
+class TagCatalog(RenderedCatalogSnapshot):
+    catalog = TAGS
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
+
+
+def catalog_response(request, snapshot):
+    """Serve a pre-rendered catalog, answering 304 from its ETag."""
+    rendered = snapshot.get()
+    response = get_conditional_response(request, etag=rendered.etag)
+    if response is None:
+        response = rendered.response(request)
+    response['ETag'] = rendered.etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+ingredient_catalog = IngredientCatalog()
+tag_catalog = TagCatalog()
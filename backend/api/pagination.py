@@ -0,0 +1,109 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class RecipePagination(PageNumberPagination):
+    """Page number pagination with an opt-in keyset mode.
+
+    Passing ``?cursor=`` switches to seeking on the queryset ordering,
+    ``(pub_date, id)`` by default, so deep pages need neither OFFSET
+    nor COUNT.
+    """
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.is_cursor_mode(request)
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_position_filter(position)
+                )
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        results = list(queryset[:page_size + 1])
+        self.page = results[:page_size]
+        self.has_next = len(results) > page_size
+        return self.page
+
+    def is_cursor_mode(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def get_ordering(self, queryset):
+        return tuple(queryset.query.order_by) or self.cursor_ordering
+
+    def get_position_filter(self, position):
+        """Match rows that come after ``position`` in the ordering."""
+        first = self.ordering[0]
+        lookup = 'lt' if first.startswith('-') else 'gt'
+        bound = Q(**{f'{first.lstrip("-")}__{lookup}e': position[0]})
+        after = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return bound & after
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor([
+                getattr(last, field.lstrip('-')) for field in self.ordering
+            ]),
+        )
+
+    def encode_cursor(self, position):
+        position = json.dumps(
+            position, default=lambda value: value.isoformat()
+        )
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+class FeedPagination(RecipePagination):
+    """Keyset-only pagination over feed entries."""
+    cursor_ordering = ('-pub_date', '-recipe_id')
+
+    def is_cursor_mode(self, request):
+        return True
@@ -1,20 +1,24 @@
-import base64
+import json
 import logging
 
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
-from django.db import transaction
+from django.core.files import File
+from django.db import models, transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
-from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.serializers import ModelSerializer, ReadOnlyField
+from rest_framework.utils import html
 from rest_framework.validators import UniqueTogetherValidator
 
-from foodgram.settings import ZERO_VALUE
+from .cache import get_subscription_resolver, render_recipes
+from .utils import decode_base64, get_decoded_size, is_valid_image
+from foodgram.settings import (BULK_MAX_IDS, IMAGE_MAX_SIZE, IMAGE_TYPES,
+                               MIME_TYPE_LENGTH, ZERO_VALUE)
 from recipes.models import (Favourite, Ingredient, IngredientAmount,
-                            Recipe, ShoppingCart, Tag)
-from users.models import Subscription
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from recipes.shopping_list import apply_recipe_change
+from recipes.storage import media_storage
 
 User = get_user_model()
 log = logging.getLogger(__name__)
@@ -41,6 +45,17 @@ class CustomUserCreateSerializer(UserCreateSerializer):
             return data
 
 
+class CustomUserListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        users = data.all() if isinstance(data, models.Manager) else data
+        users = list(users)
+        get_subscription_resolver(self.context).prefetch(
+            user.id for user in users
+        )
+        return super().to_representation(users)
+
+
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -51,41 +66,30 @@ class CustomUserSerializer(UserSerializer):
             'first_name', 'last_name',
             'is_subscribed'
         )
+        list_serializer_class = CustomUserListSerializer
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user is not None and not user.is_anonymous:
-            return obj.subscriber.filter(user=user).exists()
-        return False
-
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_subscription_resolver(self.context).is_subscribed(obj.id)
 
-class SubscriptionSerializer(serializers.ModelSerializer):
 
-    class Meta:
-        model = Subscription
-        fields = ['user', 'author']
-        read_only_fields = ('email', 'username')
-        extra_kwargs = {
-            'user': {'required': False},
-            'author': {'required': False},
-        }
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Subscription.objects.all(),
-                fields=('user', 'author'),
-                message='You have already subscribed to this user.'
-            )
-        ]
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of the resized and WebP copies of a recipe image."""
 
-    def validate(self, data):
-        if data['user'] == data['author']:
-            raise serializers.ValidationError(
-                'You cannot subscribe to yourself!'
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in value.items():
+            url = media_storage.url(name)
+            urls[variant] = (
+                request.build_absolute_uri(url) if request else url
             )
-        return data
+        return urls
 
 
 class SubscriptionRecipeShortSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -93,6 +97,9 @@ class SubscriptionRecipeShortSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_width',
+            'image_height',
+            'image_variants',
             'cooking_time'
         )
 
@@ -107,27 +114,92 @@ class SubscriptionShowSerializer(CustomUserSerializer):
             'recipes_count', 'recipes'
         )
         read_only_fields = ('email', 'username')
+        list_serializer_class = serializers.ListSerializer
+
+    def get_is_subscribed(self, obj):
+        return True
 
     def get_recipes(self, object):
-        limit = self.context.get('request').GET.get('recipes_limit')
-        recipes = object.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes = self.context.get('recipes_by_author', {}).get(object.id, [])
         return SubscriptionRecipeShortSerializer(
             recipes, many=True
         ).data
 
     def get_recipes_count(self, object):
-        return object.recipes.count()
+        return object.recipes_count
 
 
 class Base64ImageField(serializers.ImageField):
+    """Image given as a base64 data URI or as a multipart upload.
+
+    The type and declared size are checked before decoding, the payload
+    is decoded in chunks into a spooled file and only the image headers
+    are inspected. Uploads arrive already streamed to a temporary file.
+    """
+    default_error_messages = {
+        'unsupported_type': 'Unsupported image type {mime_type}.',
+        'too_large': f'The image must not exceed {IMAGE_MAX_SIZE} bytes.',
+    }
+
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+        if not (isinstance(data, str) and data.startswith('data:image')):
+            return self.check_upload(data)
+        header, _, payload = data.partition(',')
+        mime_type, _, encoding = header[len('data:'):].partition(';')
+        if encoding != 'base64' or len(mime_type) > MIME_TYPE_LENGTH:
+            self.fail('invalid_image')
+        if mime_type not in IMAGE_TYPES:
+            self.fail('unsupported_type', mime_type=mime_type)
+        # Encoders may wrap base64 into lines.
+        payload = ''.join(payload.split())
+        if get_decoded_size(payload) > IMAGE_MAX_SIZE:
+            self.fail('too_large')
+        image_format, ext = IMAGE_TYPES[mime_type]
+        try:
+            file = decode_base64(payload)
+        except ValueError:
+            self.fail('invalid_image')
+        if not is_valid_image(file, image_format):
+            file.close()
+            self.fail('invalid_image')
+        return File(file, name='temp.' + ext)
+
+    def check_upload(self, data):
+        # Skips ImageField's own cleaning, which reads the whole file.
+        file = serializers.FileField.to_internal_value(self, data)
+        mime_type = getattr(file, 'content_type', None)
+        if mime_type not in IMAGE_TYPES:
+            self.fail('unsupported_type', mime_type=mime_type)
+        if file.size > IMAGE_MAX_SIZE:
+            self.fail('too_large')
+        if not is_valid_image(file, IMAGE_TYPES[mime_type][0]):
+            self.fail('invalid_image')
+        return file
+
+
+class FormJSONMixin:
+    """Also accept a list field as one JSON-encoded form value, which is
+    how multipart clients send nested data."""
+
+    def get_value(self, dictionary):
+        if html.is_html_input(dictionary) and self.field_name in dictionary:
+            values = dictionary.getlist(self.field_name)
+            if len(values) == 1:
+                try:
+                    value = json.loads(values[0])
+                except ValueError:
+                    return values[0]
+                if isinstance(value, list):
+                    return value
+        return super().get_value(dictionary)
+
+
+class FormJSONListField(FormJSONMixin, serializers.ListField):
+    pass
+
+
+class FormJSONListSerializer(FormJSONMixin, serializers.ListSerializer):
+    pass
 
 
 class IngredientSerializer(ModelSerializer):
@@ -153,12 +225,22 @@ class TagSerializer(ModelSerializer):
         )
 
 
+def get_objects(model, ids, message):
+    """Resolve ids with one query, reporting every unknown id at once."""
+    objects = model.objects.in_bulk(ids)
+    missing = [str(pk) for pk in ids if pk not in objects]
+    if missing:
+        raise ValidationError(f'{message}: {", ".join(missing)}')
+    return [objects[pk] for pk in ids]
+
+
 class IngredientsInRecipeWriteSerializer(ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = IngredientAmount
         fields = ('id', 'amount')
+        list_serializer_class = FormJSONListSerializer
 
 
 class IngredientFullSerializer(ModelSerializer):
@@ -172,6 +254,13 @@ class IngredientFullSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RecipeGETListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return render_recipes(list(recipes), self.child)
+
+
 class RecipeGETSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
@@ -181,6 +270,7 @@ class RecipeGETSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -193,11 +283,27 @@ class RecipeGETSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_width',
+            'image_height',
+            'image_variants',
             'text',
             'cooking_time'
         )
+        list_serializer_class = RecipeGETListSerializer
+
+    def to_representation(self, instance):
+        representations = render_recipes([instance], self)
+        if not representations:
+            # Deleted after it was loaded for this request.
+            raise NotFound
+        return representations[0]
+
+    def to_shared_representation(self, instance):
+        return super().to_representation(instance)
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context.get('request').user
         return (
             False if user.is_anonymous
@@ -205,6 +311,8 @@ class RecipeGETSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, object):
+        if hasattr(object, 'is_in_shopping_cart'):
+            return object.is_in_shopping_cart
         return (self.context.get('request').user.is_authenticated
                 and ShoppingCart.objects.filter(
                     user=self.context.get('request').user,
@@ -213,8 +321,7 @@ class RecipeGETSerializer(serializers.ModelSerializer):
 
 
 class RecipeSerializer(ModelSerializer):
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                  many=True)
+    tags = FormJSONListField(child=serializers.IntegerField(min_value=1))
     ingredients = IngredientsInRecipeWriteSerializer(many=True)
     image = Base64ImageField(use_url=True, max_length=None)
     author = CustomUserSerializer(read_only=True)
@@ -249,6 +356,11 @@ class RecipeSerializer(ModelSerializer):
                 raise ValidationError({
                     'amount': f'The amount must be greater than {ZERO_VALUE}!'
                 })
+        ingredients = get_objects(
+            Ingredient, ingredients_list, 'Unknown ingredients'
+        )
+        for ingredient, item in zip(ingredients, value):
+            item['id'] = ingredient
         return value
 
     def validate_tags(self, tags):
@@ -260,7 +372,7 @@ class RecipeSerializer(ModelSerializer):
             raise serializers.ValidationError(
                 'The tags must be unique!'
             )
-        return tags
+        return get_objects(Tag, tags, 'Unknown tags')
 
     def create_ingredients_amounts(self, ingredients, recipe):
         IngredientAmount.objects.bulk_create(
@@ -271,6 +383,45 @@ class RecipeSerializer(ModelSerializer):
             ) for ingredient in ingredients]
         )
 
+    def update_ingredients_amounts(self, ingredients, recipe):
+        """Write only the amounts that differ from the stored ones and
+        return the amounts as they were before."""
+        current = {
+            amount.ingredient_id: amount
+            for amount in recipe.ingredients_in_recipes.all()
+        }
+        submitted = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - submitted.keys()
+        if removed:
+            IngredientAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = [
+            IngredientAmount(pk=current[ingredient_id].pk, amount=amount)
+            for ingredient_id, amount in submitted.items()
+            if ingredient_id in current
+            and current[ingredient_id].amount != amount
+        ]
+        if changed:
+            # Bulk writes skip the signals; the recipe saved afterwards
+            # drops its cached representation instead.
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        added = [
+            IngredientAmount(
+                ingredient_id=ingredient_id, recipe=recipe, amount=amount
+            ) for ingredient_id, amount in submitted.items()
+            if ingredient_id not in current
+        ]
+        if added:
+            IngredientAmount.objects.bulk_create(added)
+        return {
+            ingredient_id: amount.amount
+            for ingredient_id, amount in current.items()
+        }
+
     @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
@@ -285,9 +436,12 @@ class RecipeSerializer(ModelSerializer):
     def update(self, instance, validated_data):
         if 'ingredients' in validated_data:
             ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients_amounts(ingredients, instance)
+            amounts_before = self.update_ingredients_amounts(
+                ingredients, instance
+            )
+            apply_recipe_change(instance.id, amounts_before)
         if 'tags' in validated_data:
+            # set() already diffs against the stored tags.
             instance.tags.set(
                 validated_data.pop('tags'))
         return super().update(
@@ -296,16 +450,39 @@ class RecipeSerializer(ModelSerializer):
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.with_user_flags(
+            request.user).get(pk=instance.pk)
         return RecipeGETSerializer(
             instance, context=context).data
 
 
+class ShoppingListItemSerializer(ModelSerializer):
+    id = ReadOnlyField(source='ingredient.id')
+    name = ReadOnlyField(source='ingredient.name')
+    measurement_unit = ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS,
+    )
+
+
 class RecipeLightSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
         fields = [
-            'id', 'name', 'image',
-            'cooking_time'
+            'id', 'name', 'image', 'image_width', 'image_height',
+            'image_variants', 'cooking_time'
         ]
 
 
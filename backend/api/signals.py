@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_recipes
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+
+User = get_user_model()
+
+RENDERED_USER_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+def touch_recipes(pks):
+    """Bump ``updated_at`` of recipes whose rendering changed through
+    a related row, and drop their cached representations."""
+    pks = set(pks)
+    Recipe.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+    invalidate_recipes(pks)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def ingredient_amount_changed(sender, instance, **kwargs):
+    touch_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            touch_recipes([instance.pk])
+    elif action == 'pre_clear':
+        touch_recipes(instance.recipes.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def catalog_item_changed(sender, instance, **kwargs):
+    touch_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not RENDERED_USER_FIELDS & set(update_fields):
+        return
+    touch_recipes(instance.recipes.values_list('id', flat=True))
@@ -1,23 +1,174 @@
+import base64
+import binascii
+import csv
+import hashlib
+import os
 from datetime import datetime
+from tempfile import SpooledTemporaryFile
 
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from PIL import Image
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 
+from foodgram.settings import (FILE_CHUNK_SIZE, FILE_SPOOL_SIZE,
+                               IMAGE_MAX_PIXELS, PDF_FONT_NAME, PDF_FONT_PATH,
+                               PDF_FONT_SIZE, PDF_LINE_HEIGHT, PDF_MARGIN)
 
-def create_shopping_cart(ingredients_cart, user):
-    today = datetime.today()
-    shopping_cart = (
-        f'Shopping cart for: {user.get_full_name()}\n\n'
-        f'Date: {today:%Y-%m-%d}\n\n')
-    shopping_cart += '\n'.join(
-        [
+
+def get_decoded_size(payload):
+    """Size of base64 text once decoded, computed without decoding."""
+    return len(payload) * 3 // 4 - payload[-2:].count('=')
+
+
+def decode_base64(payload):
+    """Decode base64 text chunk by chunk into a spooled temporary file.
+
+    Raises ``ValueError`` on malformed input.
+    """
+    buffer = SpooledTemporaryFile(max_size=FILE_SPOOL_SIZE)
+    try:
+        # FILE_CHUNK_SIZE is a multiple of 4, so chunks decode on their own.
+        for start in range(0, len(payload), FILE_CHUNK_SIZE):
+            buffer.write(base64.b64decode(
+                payload[start:start + FILE_CHUNK_SIZE], validate=True
+            ))
+    except binascii.Error:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+def is_valid_image(file, image_format):
+    """Check the header and structure of an image without decoding its
+    pixels."""
+    try:
+        with Image.open(file) as image:
+            if image.format != image_format:
+                return False
+            if image.width * image.height > IMAGE_MAX_PIXELS:
+                return False
+            image.verify()
+    except (Image.DecompressionBombError, OSError, SyntaxError,
+            ValueError):
+        return False
+    finally:
+        file.seek(0)
+    return True
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def conditional_response(request, etag, last_modified=None):
+    """Return a 304 response if the client already holds this version."""
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=(
+            int(last_modified.timestamp()) if last_modified else None
+        ),
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def shopping_cart_lines(ingredients_cart, user, today):
+    yield f'Shopping cart for: {user.get_full_name()}'
+    yield ''
+    yield f'Date: {today:%Y-%m-%d}'
+    yield ''
+    for ingredient in ingredients_cart:
+        yield (
             f'- {ingredient["ingredient__name"]} '
             f'({ingredient["ingredient__measurement_unit"]})'
             f' - {ingredient["amount"]}'
-            for ingredient in ingredients_cart
-        ]
+        )
+    yield ''
+    yield f'Foodgram ({today:%Y})'
+
+
+def shopping_cart_txt(ingredients_cart, user, today):
+    for line in shopping_cart_lines(ingredients_cart, user, today):
+        yield f'{line}\n'
+
+
+class Echo:
+    """File-like object that hands each written row back to csv."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_csv(ingredients_cart, user, today):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients_cart:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def get_pdf_font():
+    if not os.path.exists(PDF_FONT_PATH):
+        return 'Helvetica'
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, PDF_FONT_PATH))
+    return PDF_FONT_NAME
+
+
+def shopping_cart_pdf(ingredients_cart, user, today):
+    """Draw the list as rows arrive, then stream the finished file.
+
+    reportlab keeps every page in memory until ``save()`` writes the
+    whole document; only the serialized bytes go to a spooled
+    temporary file before they are streamed.
+    """
+    font = get_pdf_font()
+    with SpooledTemporaryFile(max_size=FILE_SPOOL_SIZE) as buffer:
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - PDF_MARGIN
+        pdf.setFont(font, PDF_FONT_SIZE)
+        for line in shopping_cart_lines(ingredients_cart, user, today):
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, y, line)
+            y -= PDF_LINE_HEIGHT
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(FILE_CHUNK_SIZE), b'')
+
+
+SHOPPING_CART_WRITERS = {
+    'txt': (shopping_cart_txt, 'text/plain; charset=utf-8'),
+    'csv': (shopping_cart_csv, 'text/csv; charset=utf-8'),
+    'pdf': (shopping_cart_pdf, 'application/pdf'),
+}
+
+
+def create_shopping_cart(ingredients_cart, user, file_format='txt'):
+    writer, content_type = SHOPPING_CART_WRITERS[file_format]
+    filename = f'{user.username}_shopping_cart.{file_format}'
+    response = StreamingHttpResponse(
+        writer(ingredients_cart, user, datetime.today()),
+        content_type=content_type
     )
-    shopping_cart += f'\n\nFoodgram ({today:%Y})'
-    filename = f'{user.username}_shopping_cart.txt'
-    response = HttpResponse(shopping_cart, content_type='text/plain')
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
@@ -1,27 +1,35 @@
 import logging
+from collections import defaultdict
 
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from .cache import get_subscription_resolver
+from .catalogs import catalog_response, ingredient_catalog, tag_catalog
 from .filters import IngredientFilter, RecipeFilter
+from .pagination import FeedPagination, RecipePagination
 from .permissions import IsAuthorOrAdminReadOnly
-from .serializers import (CustomUserSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeGETSerializer,
-                          RecipeSerializer, ShoppingCartSerializer,
-                          SubscriptionSerializer, SubscriptionShowSerializer,
-                          TagSerializer)
-from .utils import create_shopping_cart
-from recipes.models import (Favourite, Ingredient,
-                            IngredientAmount, Recipe,
-                            ShoppingCart, Tag)
-from users.models import Subscription
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .serializers import (BulkIdsSerializer, CustomUserSerializer,
+                          FavoriteSerializer, IngredientSerializer,
+                          RecipeGETSerializer, RecipeSerializer,
+                          ShoppingCartSerializer, ShoppingListItemSerializer,
+                          SubscriptionShowSerializer, TagSerializer)
+from .utils import (conditional_response, create_shopping_cart, make_etag,
+                    set_validators)
+from foodgram.settings import SHOPPING_CART_CHUNK_SIZE
+from recipes.ingredient_index import ingredient_index
+from recipes.links import (favourite_links, shopping_cart_links,
+                           subscription_links)
+from recipes.models import FeedEntry, Ingredient, Recipe, Tag
 
 User = get_user_model()
 
@@ -29,6 +37,59 @@ logging.basicConfig(format='%(message)s')
 log = logging.getLogger(__name__)
 
 
+def get_target_id(value):
+    if not str(value).isdecimal():
+        raise NotFound
+    return int(value)
+
+
+def add_link(request, links, target_id, message):
+    """Link the target in one statement, telling a missing target from
+    an existing link only when nothing was inserted."""
+    if not links.add(request.user.id, [target_id]):
+        if not links.get_existing([target_id]):
+            raise NotFound
+        raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+
+
+def remove_link(request, links, target_id):
+    if not links.remove(request.user.id, [target_id]):
+        raise NotFound
+
+
+def change_links(request, links):
+    """Add (POST) or remove (DELETE) links to the ``ids`` in the body and
+    report the outcome for every id."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    user_id = request.user.id
+    adding = request.method == 'POST'
+    existing = links.get_existing(ids)
+    allowed = [
+        target_id for target_id in ids
+        if target_id in existing and links.is_allowed(user_id, target_id)
+    ]
+    changed = set()
+    if allowed:
+        changed = set(
+            links.add(user_id, allowed) if adding
+            else links.remove(user_id, allowed)
+        )
+    results = []
+    for target_id in ids:
+        if target_id not in existing:
+            outcome = 'not_found'
+        elif not links.is_allowed(user_id, target_id):
+            outcome = 'not_allowed'
+        elif target_id in changed:
+            outcome = 'added' if adding else 'removed'
+        else:
+            outcome = 'already_added' if adding else 'not_added'
+        results.append({'id': target_id, 'status': outcome})
+    return Response({'results': results})
+
+
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
@@ -61,21 +122,33 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=self.kwargs.get('id'))
+        author_id = get_target_id(self.kwargs.get('id'))
         if request.method == 'POST':
-            serializer = SubscriptionSerializer(
-                data={'user': request.user.id, 'author': author.id}
+            if author_id == request.user.id:
+                raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                    'You cannot subscribe to yourself!'
+                ]})
+            add_link(
+                request, subscription_links, author_id,
+                'You have already subscribed to this user.'
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
             return Response(
-                serializer.data, status=status.HTTP_201_CREATED
+                {'user': request.user.id, 'author': author_id},
+                status=status.HTTP_201_CREATED
             )
-        subscription = get_object_or_404(
-            Subscription, user=request.user, author=author)
-        subscription.delete()
+        remove_link(request, subscription_links, author_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe/bulk',
+        url_name='subscribe_bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_bulk(self, request):
+        return change_links(request, subscription_links)
+
     @action(
         detail=False,
         methods=['get'],
@@ -84,18 +157,63 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
+        limit = request.query_params.get('recipes_limit')
+        if limit is not None:
+            if not limit.isdecimal():
+                raise ValidationError({
+                    'recipes_limit': 'Must be a non-negative integer.'
+                })
+            limit = int(limit)
         authors = User.objects.filter(
             id__in=request.user.subscriber.all().values_list(
                 'author_id', flat=True
             )
         )
         paginated_queryset = self.paginate_queryset(authors)
+        recipes_by_author = defaultdict(list)
+        for recipe in Recipe.objects.latest_by_author(
+            [author.id for author in paginated_queryset], limit
+        ):
+            recipes_by_author[recipe.author_id].append(recipe)
         serializer = SubscriptionShowSerializer(
-            paginated_queryset, many=True, context={'request': request})
+            paginated_queryset, many=True, context={
+                'request': request,
+                'recipes_by_author': recipes_by_author,
+            })
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='feed',
+        url_name='feed',
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        entries = self.paginate_queryset(
+            FeedEntry.objects.filter(user=request.user)
+        )
+        recipes = Recipe.objects.with_user_flags(request.user).in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        serializer = RecipeGETSerializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True, context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class CatalogMixin:
+    """Serve the unfiltered list from a pre-rendered catalog."""
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, self.catalog)
+
+
+class IngredientViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
@@ -103,10 +221,23 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ('^name', )
     pagination_class = None
+    catalog = ingredient_catalog
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        ingredients = ingredient_index.get().search(name)
+        etag = make_etag(ingredients)
+        response = conditional_response(request, etag)
+        if response is None:
+            response = Response(ingredients)
+        return set_validators(response, etag)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
+    catalog = tag_catalog
     serializer_class = TagSerializer
     pagination_class = None
 
@@ -117,6 +248,59 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthorOrAdminReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+    parser_classes = (JSONParser, MultiPartParser)
+
+    def get_queryset(self):
+        if self.request.method in ('GET', 'HEAD'):
+            return Recipe.objects.with_user_flags(self.request.user)
+        return Recipe.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        context = self.get_serializer_context()
+        subscriptions = get_subscription_resolver(context)
+        subscriptions.prefetch(recipe.author_id for recipe in page)
+        etag = make_etag(
+            request.build_absolute_uri(),
+            request.user.pk,
+            self.paginator.get_paginated_response([]).data,
+            [(recipe.pk, recipe.updated_at, recipe.is_favorited,
+              recipe.is_in_shopping_cart,
+              subscriptions.is_subscribed(recipe.author_id))
+             for recipe in page],
+        )
+        response = conditional_response(request, etag)
+        if response is None:
+            serializer = self.get_serializer(
+                page, many=True, context=context
+            )
+            response = self.get_paginated_response(serializer.data)
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        context = self.get_serializer_context()
+        subscriptions = get_subscription_resolver(context)
+        etag = make_etag(
+            request.build_absolute_uri(),
+            request.user.pk,
+            recipe.pk,
+            recipe.updated_at,
+            recipe.is_favorited,
+            recipe.is_in_shopping_cart,
+            subscriptions.is_subscribed(recipe.author_id),
+        )
+        last_modified = (
+            recipe.updated_at if request.user.is_anonymous else None
+        )
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            serializer = self.get_serializer(recipe, context=context)
+            response = Response(serializer.data)
+        return set_validators(response, etag, last_modified)
 
     @action(
         detail=True,
@@ -126,23 +310,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
+        recipe_id = get_target_id(pk)
         if request.method == 'POST':
-            serializer = FavoriteSerializer(
-                data={'user': request.user.id, 'recipe': recipe.id}
+            add_link(
+                request, favourite_links, recipe_id,
+                'Have you already added this recipe to your favorites'
+            )
+            favorite_serializer = FavoriteSerializer(
+                Recipe.objects.get(pk=recipe_id)
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            favorite_serializer = FavoriteSerializer(recipe)
             return Response(
                 favorite_serializer.data, status=status.HTTP_201_CREATED
             )
-        favorite_recipe = get_object_or_404(
-            Favourite, user=request.user, recipe=recipe
-        )
-        favorite_recipe.delete()
+        remove_link(request, favourite_links, recipe_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/bulk',
+        url_name='favorite_bulk',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        return change_links(request, favourite_links)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -151,43 +343,72 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
+        recipe_id = get_target_id(pk)
         if request.method == 'POST':
-            serializer = ShoppingCartSerializer(
-                data={'user': request.user.id, 'recipe': recipe.id}
+            add_link(
+                request, shopping_cart_links, recipe_id,
+                'Have you already added this recipe to your card'
+            )
+            shopping_cart_serializer = ShoppingCartSerializer(
+                Recipe.objects.get(pk=recipe_id)
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            shopping_cart_serializer = ShoppingCartSerializer(recipe)
             return Response(
                 shopping_cart_serializer.data, status=status.HTTP_201_CREATED
             )
-        shopping_cart_recipe = get_object_or_404(
-            ShoppingCart, user=request.user, recipe=recipe
-        )
-        shopping_cart_recipe.delete()
+        remove_link(request, shopping_cart_links, recipe_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/bulk',
+        url_name='shopping_cart_bulk',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        return change_links(request, shopping_cart_links)
+
     @action(
         detail=False,
         methods=['get'],
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, PDFRenderer),
     )
     def download_shopping_cart(self, request):
         user = request.user
         if not user.shopping_cart.exists():
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        ingredients_cart = IngredientAmount.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
+        ingredients_cart = user.shopping_list.values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        return create_shopping_cart(ingredients_cart, user)
+            'ingredient__measurement_unit',
+            'amount'
+        ).order_by('ingredient__name')
+        return create_shopping_cart(
+            ingredients_cart.iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE),
+            user,
+            request.accepted_renderer.format
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='shopping_list',
+        url_name='shopping_list',
+        permission_classes=(permissions.IsAuthenticated,),
+        pagination_class=None,
+    )
+    def shopping_list(self, request):
+        serializer = ShoppingListItemSerializer(
+            request.user.shopping_list.select_related(
+                'ingredient'
+            ).order_by('ingredient__name'),
+            many=True
+        )
+        return Response(serializer.data)
 
     def get_serializer_class(self):
-        if self.request.method == 'GET':
+        if self.request.method in ('GET', 'HEAD'):
             return RecipeGETSerializer
         return RecipeSerializer
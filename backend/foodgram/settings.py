@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'debug_toolbar',
     'rest_framework',
     'rest_framework.authtoken',
@@ -135,6 +136,83 @@ DATABASES = {
     }
 }
 
+# Cache
+# LocMemCache is per process; set CACHE_BACKEND to
+# django.core.cache.backends.filebased.FileBasedCache and CACHE_LOCATION
+# to a shared directory when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+
+CATALOG_TTL = 60 * 5
+
+FEED_BATCH_SIZE = 1000
+
+FEED_BACKFILL_SIZE = 100
+
+SHOPPING_CART_CHUNK_SIZE = 2000
+
+SHOPPING_LIST_BATCH_SIZE = 1000
+
+BULK_MAX_IDS = 100
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+FILE_SPOOL_SIZE = 1024 * 1024
+
+# Uploads go straight to a temporary file instead of memory.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+IMAGE_TYPES = {
+    'image/jpeg': ('JPEG', 'jpg'),
+    'image/png': ('PNG', 'png'),
+    'image/gif': ('GIF', 'gif'),
+    'image/webp': ('WEBP', 'webp'),
+}
+
+# RFC 6838 allows 127 characters for each of the type and subtype.
+MIME_TYPE_LENGTH = 255
+
+IMAGE_MAX_SIZE = 2 * 1024 * 1024
+
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+IMAGE_VARIANTS = {
+    'small': (240, 240),
+    'medium': (640, 640),
+}
+
+IMAGE_VARIANTS_DIR = 'recipes/variants'
+
+IMAGE_QUALITY = 80
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+PDF_FONT_NAME = 'DejaVuSans'
+
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+PDF_FONT_SIZE = 12
+
+PDF_LINE_HEIGHT = 18
+
+PDF_MARGIN = 50
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -172,8 +250,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+MEDIA_SHARD_DEPTH = 2
+
+MEDIA_GC_GRACE_HOURS = 24
+
+MEDIA_GC_CHUNK_SIZE = 2000
+
 CSV_FILES_DIR = os.path.join(BASE_DIR, 'data')
 
+INGREDIENTS_BATCH_SIZE = 1000
+
 STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
@@ -201,3 +287,5 @@ UNIT_LENGTH = 150
 NUMBER_OF_RECIPES = 6
 
 ZERO_VALUE = 0
+
+SEARCH_CONFIG = 'russian'
@@ -4,6 +4,7 @@ from django.forms.models import BaseInlineFormSet
 
 from .models import (Favourite, Ingredient, IngredientAmount, Recipe,
                      ShoppingCart, Tag)
+from .shopping_list import apply_recipe_change, get_recipe_amounts
 
 from foodgram.settings import ZERO_VALUE
 
@@ -36,7 +37,14 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
     def added_in_favorites(self, obj):
-        return obj.favourites.count()
+        return obj.favourites_count
+
+    def save_related(self, request, form, formsets, change):
+        amounts_before = (
+            get_recipe_amounts(form.instance.pk) if change else {}
+        )
+        super().save_related(request, form, formsets, change)
+        apply_recipe_change(form.instance.pk, amounts_before)
 
 
 class IngredientAdmin(admin.ModelAdmin):
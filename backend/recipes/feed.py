@@ -0,0 +1,43 @@
+from itertools import islice
+
+from foodgram.settings import FEED_BACKFILL_SIZE, FEED_BATCH_SIZE
+from users.models import Subscription
+
+from .models import FeedEntry, Recipe
+
+
+def fan_out_recipe(recipe):
+    """Add a new recipe to the feeds of its author's followers."""
+    followers = Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).order_by().values_list('user_id', flat=True).iterator(
+        chunk_size=FEED_BATCH_SIZE
+    )
+    while True:
+        batch = list(islice(followers, FEED_BATCH_SIZE))
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe_id=recipe.id,
+                       pub_date=recipe.pub_date)
+             for user_id in batch],
+            ignore_conflicts=True,
+        )
+
+
+def backfill_feed(user_id, author_id):
+    """Copy the author's latest recipes into a new follower's feed."""
+    recipes = Recipe.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date'
+    )[:FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+         for recipe_id, pub_date in recipes],
+        ignore_conflicts=True,
+    )
+
+
+def trim_feed(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
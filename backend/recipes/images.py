@@ -0,0 +1,143 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connection, connections, transaction
+from PIL import Image, ImageOps
+
+from foodgram.settings import (IMAGE_QUALITY, IMAGE_VARIANTS,
+                               IMAGE_VARIANTS_DIR, IMAGE_WORKERS)
+
+from .models import Recipe
+from .storage import media_storage
+
+log = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    # Workers only write files; keep them from inheriting sockets.
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+
+
+def save_variant(image, name, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=IMAGE_QUALITY)
+    return media_storage.write(name, ContentFile(buffer.getvalue()))
+
+
+def render_variants(name):
+    """Render the resized and WebP variants of a stored image.
+
+    Runs in a worker process, so the files are written without taking
+    references. Returns the display size of the image and the storage
+    names of its variants.
+    """
+    with media_storage.open(name) as file, Image.open(file) as source:
+        image_format = 'JPEG' if source.format == 'JPEG' else 'PNG'
+        extension = image_format.lower().replace('jpeg', 'jpg')
+        image = ImageOps.exif_transpose(source)
+        width, height = image.size
+        stem = os.path.splitext(os.path.basename(name))[0]
+        variants = {}
+        for variant, size in IMAGE_VARIANTS.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail(size)
+            variants[variant] = save_variant(
+                thumbnail,
+                f'{IMAGE_VARIANTS_DIR}/{stem}_{variant}.{extension}',
+                image_format,
+            )
+            variants[f'{variant}_webp'] = save_variant(
+                thumbnail,
+                f'{IMAGE_VARIANTS_DIR}/{stem}_{variant}.webp',
+                'WEBP',
+            )
+    return width, height, variants
+
+
+@transaction.atomic
+def store_variants(recipe_id, name, result):
+    """Record rendered variants unless the image was replaced meanwhile."""
+    recipe = Recipe.objects.select_for_update().filter(
+        pk=recipe_id, image=name
+    ).first()
+    if recipe is None:
+        return
+    previous = recipe.image_variants.values()
+    recipe.image_width, recipe.image_height, recipe.image_variants = result
+    for variant in recipe.image_variants.values():
+        media_storage.add_reference(variant)
+        # Written unreferenced by the worker, so it may have been
+        # collected before the reference was taken.
+        if not media_storage.exists(variant):
+            raise FileNotFoundError(variant)
+    for variant in previous:
+        media_storage.delete(variant)
+    recipe.save(update_fields=(
+        'image_width', 'image_height', 'image_variants', 'updated_at'
+    ))
+
+
+def variants_rendered(recipe_id, name, future):
+    try:
+        store_variants(recipe_id, name, future.result())
+    except Exception:
+        log.exception('Could not process image %s', name)
+    finally:
+        # Callbacks run on the executor's own thread.
+        connection.close()
+
+
+def submit_render(name):
+    try:
+        return get_executor().submit(render_variants, name)
+    except BrokenProcessPool:
+        # A worker died and took the pool with it; start a new one.
+        log.warning('Image worker pool is broken, restarting it')
+        get_executor().shutdown(wait=False)
+        get_executor.cache_clear()
+        return get_executor().submit(render_variants, name)
+
+
+def process_image(recipe_id, name):
+    """Render the variants in the background and record them.
+
+    Runs after the commit, so failures are logged instead of failing
+    the request and the hooks queued after this one.
+    """
+    try:
+        future = submit_render(name)
+    except Exception:
+        log.exception('Could not schedule image %s', name)
+        return
+    future.add_done_callback(
+        lambda future: variants_rendered(recipe_id, name, future)
+    )
+
+
+def get_stored_files(recipe_id):
+    """Names of the image and variants a recipe currently references."""
+    stored = Recipe.objects.filter(pk=recipe_id).values_list(
+        'image', 'image_variants'
+    ).first()
+    if stored is None:
+        return []
+    image, variants = stored
+    return [name for name in (image, *variants.values()) if name]
+
+
+def release_files(names):
+    """Drop a recipe's references to files it no longer uses."""
+    for name in names:
+        try:
+            media_storage.delete(name)
+        except Exception:
+            log.exception('Could not release file %s', name)
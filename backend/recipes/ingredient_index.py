@@ -0,0 +1,47 @@
+import sys
+from bisect import bisect_left
+
+from django.db.models import Count
+
+from .models import Ingredient
+from .snapshots import INGREDIENTS, CatalogSnapshot
+
+
+class IngredientIndex:
+    """Immutable case-folded prefix index of the ingredient catalog.
+
+    Rows are sorted by folded name, so a prefix maps to one contiguous
+    slice found by bisection. Matches are ranked by how many recipes
+    use the ingredient.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(
+            (name.casefold(), -usage, name, pk, measurement_unit)
+            for pk, name, measurement_unit, usage in rows
+        )
+        self.keys = tuple(row[0] for row in rows)
+        self.rows = tuple(row[1:] for row in rows)
+
+    def search(self, prefix):
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + chr(sys.maxunicode), start)
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, name, pk, measurement_unit in sorted(self.rows[start:end])
+        ]
+
+
+class IngredientIndexSnapshot(CatalogSnapshot):
+    catalog = INGREDIENTS
+
+    def build(self):
+        return IngredientIndex(
+            Ingredient.objects.annotate(
+                usage=Count('ingredients_in_recipes')
+            ).values_list('id', 'name', 'measurement_unit', 'usage')
+        )
+
+
+ingredient_index = IngredientIndexSnapshot()
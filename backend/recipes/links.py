@@ -0,0 +1,154 @@
+from django.db import connection, transaction
+from django.db.models import F
+
+from users.models import Subscription
+
+from .feed import backfill_feed, trim_feed
+from .models import Favourite, ShoppingCart
+from .shopping_list import apply_cart_change
+
+
+def change_counters(model, pks, field, delta):
+    """Shift a denormalized counter on several rows in a single UPDATE."""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def fetch_column(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+class UserLinks:
+    """Rows linking a user to recipes or authors.
+
+    Links are added and removed with single ``INSERT ... ON CONFLICT DO
+    NOTHING RETURNING`` and ``DELETE ... RETURNING`` statements, so the
+    unique constraint decides which rows changed. Raw statements skip
+    the model signals, so the counters and derived tables they maintain
+    are updated here for exactly those rows.
+    """
+    model = None
+    target_field = None
+    counter_field = None
+
+    @property
+    def target_model(self):
+        return self.model._meta.get_field(self.target_field).related_model
+
+    def get_existing(self, target_ids):
+        return set(self.target_model.objects.filter(
+            pk__in=target_ids
+        ).values_list('pk', flat=True))
+
+    def is_allowed(self, user_id, target_id):
+        return True
+
+    def get_sql_names(self):
+        quote_name = connection.ops.quote_name
+        return (
+            quote_name(self.model._meta.db_table),
+            quote_name(self.model._meta.get_field('user').column),
+            quote_name(self.model._meta.get_field(self.target_field).column),
+        )
+
+    def insert(self, user_id, target_ids):
+        """Link the existing targets and return the newly linked ids."""
+        table, user_column, target_column = self.get_sql_names()
+        target_table = connection.ops.quote_name(
+            self.target_model._meta.db_table
+        )
+        target_pk = connection.ops.quote_name(
+            self.target_model._meta.pk.column
+        )
+        placeholders = ', '.join(['%s'] * len(target_ids))
+        return fetch_column(
+            f'INSERT INTO {table} ({user_column}, {target_column}) '
+            f'SELECT %s, {target_pk} FROM {target_table} '
+            f'WHERE {target_pk} IN ({placeholders}) '
+            f'ON CONFLICT ({user_column}, {target_column}) DO NOTHING '
+            f'RETURNING {target_column}',
+            [user_id, *target_ids]
+        )
+
+    def delete(self, user_id, target_ids):
+        """Unlink the targets and return the ids that were linked."""
+        table, user_column, target_column = self.get_sql_names()
+        placeholders = ', '.join(['%s'] * len(target_ids))
+        return fetch_column(
+            f'DELETE FROM {table} WHERE {user_column} = %s '
+            f'AND {target_column} IN ({placeholders}) '
+            f'RETURNING {target_column}',
+            [user_id, *target_ids]
+        )
+
+    @transaction.atomic
+    def add(self, user_id, target_ids):
+        added = self.insert(user_id, target_ids)
+        if added:
+            self.linked(user_id, added)
+        return added
+
+    @transaction.atomic
+    def remove(self, user_id, target_ids):
+        removed = self.delete(user_id, target_ids)
+        if removed:
+            self.unlinked(user_id, removed)
+        return removed
+
+    def linked(self, user_id, target_ids):
+        change_counters(
+            self.target_model, target_ids, self.counter_field, 1
+        )
+
+    def unlinked(self, user_id, target_ids):
+        change_counters(
+            self.target_model, target_ids, self.counter_field, -1
+        )
+
+
+class FavouriteLinks(UserLinks):
+    model = Favourite
+    target_field = 'recipe'
+    counter_field = 'favourites_count'
+
+
+class ShoppingCartLinks(UserLinks):
+    model = ShoppingCart
+    target_field = 'recipe'
+    counter_field = 'in_carts_count'
+
+    def linked(self, user_id, target_ids):
+        super().linked(user_id, target_ids)
+        apply_cart_change(user_id, target_ids, 1)
+
+    def unlinked(self, user_id, target_ids):
+        super().unlinked(user_id, target_ids)
+        apply_cart_change(user_id, target_ids, -1)
+
+
+class SubscriptionLinks(UserLinks):
+    model = Subscription
+    target_field = 'author'
+    counter_field = 'followers_count'
+
+    def is_allowed(self, user_id, target_id):
+        return user_id != target_id
+
+    def linked(self, user_id, target_ids):
+        super().linked(user_id, target_ids)
+        for author_id in target_ids:
+            backfill_feed(user_id, author_id)
+
+    def unlinked(self, user_id, target_ids):
+        super().unlinked(user_id, target_ids)
+        for author_id in target_ids:
+            trim_feed(user_id, author_id)
+
+
+favourite_links = FavouriteLinks()
+shopping_cart_links = ShoppingCartLinks()
+subscription_links = SubscriptionLinks()
@@ -0,0 +1,69 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, ShoppingCart
+
+User = get_user_model()
+
+SIZES = (10, 100, 1000)
+INGREDIENTS_PER_RECIPE = 10
+REPEATS = 20
+
+
+def measure(queryset):
+    start = perf_counter()
+    for _ in range(REPEATS):
+        list(queryset.all())
+    return (perf_counter() - start) / REPEATS * 1000
+
+
+class Command(BaseCommand):
+    help = ('Comparing the aggregated shopping list read with the '
+            'download-time aggregation, all data is rolled back')
+
+    def handle(self, *args, **kwargs):
+        for size in SIZES:
+            with transaction.atomic():
+                self.stdout.write(self.run(size))
+                transaction.set_rollback(True)
+
+    def run(self, size):
+        user = User.objects.create_user(
+            username='benchmark', email='benchmark@example.com',
+            first_name='benchmark', last_name='benchmark',
+        )
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'benchmark {i}', measurement_unit='g'
+            ) for i in range(INGREDIENTS_PER_RECIPE * 5)
+        ]
+        for i in range(size):
+            recipe = Recipe.objects.create(
+                author=user, name=f'benchmark {i}', text='benchmark',
+                cooking_time=1, image='recipes/benchmark.jpg',
+            )
+            IngredientAmount.objects.bulk_create([
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                ) for ingredient in ingredients[
+                    i % 5::5][:INGREDIENTS_PER_RECIPE]
+            ])
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        aggregated = IngredientAmount.objects.filter(
+            recipe__shopping_cart__user=user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
+        stored = user.shopping_list.values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')
+        if list(aggregated) != list(stored):
+            raise CommandError('Shopping list differs from the carts')
+        return (
+            f'{size} recipes: aggregate {measure(aggregated):.2f} ms, '
+            f'shopping list {measure(stored):.2f} ms'
+        )
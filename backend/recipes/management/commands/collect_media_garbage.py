@@ -0,0 +1,103 @@
+import heapq
+import os
+from time import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Collate
+
+from foodgram.settings import MEDIA_GC_CHUNK_SIZE, MEDIA_GC_GRACE_HOURS
+from recipes.models import MediaBlob, Recipe
+from recipes.storage import media_storage
+
+
+def in_code_point_order(field):
+    # PostgreSQL sorts by locale unless told otherwise; SQLite's default
+    # BINARY collation already matches Python's string order.
+    if connection.vendor == 'postgresql':
+        return Collate(field, 'C')
+    return F(field)
+
+
+def walk(root, prefix):
+    """Yield ``(name, entry)`` for files under ``root`` in name order.
+
+    Directories sort as if their names ended with a slash, so the names
+    come out in the same order as sorted strings.
+    """
+    with os.scandir(root) as entries:
+        entries = sorted(entries, key=lambda entry: (
+            entry.name + '/' if entry.is_dir(follow_symlinks=False)
+            else entry.name
+        ))
+    for entry in entries:
+        name = f'{prefix}/{entry.name}'
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk(entry.path, name)
+        elif entry.is_file(follow_symlinks=False):
+            yield name, entry
+
+
+def referenced_names():
+    """Stream every referenced storage name in code point order."""
+    images = Recipe.objects.exclude(image='').order_by(
+        in_code_point_order('image')
+    ).values_list('image', flat=True).iterator(
+        chunk_size=MEDIA_GC_CHUNK_SIZE
+    )
+    blobs = MediaBlob.objects.order_by(
+        in_code_point_order('name')
+    ).values_list('name', flat=True).iterator(
+        chunk_size=MEDIA_GC_CHUNK_SIZE
+    )
+    return heapq.merge(images, blobs)
+
+
+class Command(BaseCommand):
+    help = 'Removing media files no recipe references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the files that would be removed',
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=MEDIA_GC_GRACE_HOURS,
+            help='Keep files modified more recently than this',
+        )
+        parser.add_argument(
+            '--directory',
+            default=Recipe._meta.get_field('image').upload_to.strip('/'),
+            help='Directory under MEDIA_ROOT to clean',
+        )
+
+    def handle(self, *args, **options):
+        root = media_storage.path(options['directory'])
+        if not os.path.isdir(root):
+            self.stdout.write(f'{root} does not exist')
+            return
+        cutoff = time() - options['grace_hours'] * 3600
+        references = referenced_names()
+        reference = next(references, None)
+        count = size = 0
+        for name, entry in walk(root, options['directory']):
+            while reference is not None and reference < name:
+                reference = next(references, None)
+            if reference == name:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                continue
+            count += 1
+            size += stat.st_size
+            self.stdout.write(name)
+            if not options['dry_run']:
+                media_storage.delete_unreferenced(name)
+        action = 'Found' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {count} unreferenced files, {size} bytes'
+        ))
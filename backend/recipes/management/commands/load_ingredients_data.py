@@ -1,24 +1,99 @@
 import csv
+import json
+import os
+from itertools import islice
+from time import monotonic
 
-from django.core.management.base import BaseCommand
-from foodgram.settings import CSV_FILES_DIR
+from django.core.management.base import BaseCommand, CommandError
+from foodgram.settings import (CSV_FILES_DIR, FILE_CHUNK_SIZE,
+                               INGREDIENTS_BATCH_SIZE)
 from recipes.models import Ingredient
+from recipes.snapshots import INGREDIENTS, invalidate_catalog
+
+HEADER = ('name', 'measurement_unit')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2 and tuple(row[:2]) != HEADER:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Yield the objects of a top-level JSON array without loading it
+    whole."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(FILE_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Expected a JSON array of ingredients')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Unexpected end of the JSON array')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
 
 
 class Command(BaseCommand):
     help = 'Uploading ingredients to the database'
 
-    def handle(self, *args, **kwargs):
-        with open(
-            f'{CSV_FILES_DIR}/ingredients.csv', encoding='utf-8'
-        ) as file:
-            reader = csv.reader(file)
-            next(reader)
-            ingredients = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1],
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(CSV_FILES_DIR, 'ingredients.csv'),
+            help='CSV (name,measurement_unit) or JSON array file',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=INGREDIENTS_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError(f'Unsupported file type: {path}')
+        started = monotonic()
+        count_before = Ingredient.objects.count()
+        processed = 0
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = reader(file)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                # ON CONFLICT DO NOTHING keeps reruns idempotent.
+                Ingredient.objects.bulk_create([
+                    Ingredient(
+                        name=name.strip(),
+                        measurement_unit=measurement_unit.strip(),
+                    )
+                    for name, measurement_unit in batch if name.strip()
+                ], ignore_conflicts=True)
+                processed += len(batch)
+                self.stdout.write(
+                    f'{processed} rows, {monotonic() - started:.1f}s'
                 )
-                for row in reader
-            ]
-            Ingredient.objects.bulk_create(ingredients)
+        invalidate_catalog(INGREDIENTS)
+        added = Ingredient.objects.count() - count_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} rows, added {added} ingredients '
+            f'in {monotonic() - started:.1f}s'
+        ))
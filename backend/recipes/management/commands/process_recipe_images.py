@@ -0,0 +1,49 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from foodgram.settings import IMAGE_WORKERS
+from recipes.images import render_variants, store_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Rendering resized and WebP variants of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Render again images that already have variants',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=IMAGE_WORKERS,
+            help='Number of worker processes',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_width__isnull=True)
+        images = list(recipes.values_list('pk', 'image'))
+        connections.close_all()
+        processed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(render_variants, name): (recipe_id, name)
+                for recipe_id, name in images
+            }
+            for future in as_completed(futures):
+                recipe_id, name = futures[future]
+                try:
+                    store_variants(recipe_id, name, future.result())
+                except Exception as error:
+                    self.stderr.write(f'{name}: {error}')
+                    continue
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} of {len(images)} images'
+        ))
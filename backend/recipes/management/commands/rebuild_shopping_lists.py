@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.shopping_list import find_drift, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Rebuilding aggregated shopping lists from shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report rows that differ from the shopping carts',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_drift()
+            for user_id, ingredient_id in drift:
+                self.stdout.write(
+                    f'user {user_id}, ingredient {ingredient_id}'
+                )
+            if drift:
+                raise CommandError(f'{len(drift)} rows differ')
+            self.stdout.write(self.style.SUCCESS('Shopping lists match'))
+            return
+        with transaction.atomic():
+            rebuild_shopping_lists()
+        self.stdout.write(self.style.SUCCESS('Shopping lists rebuilt'))
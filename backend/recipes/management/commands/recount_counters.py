@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favourite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .values(field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recomputing denormalized recipe and user counters'
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        recipes = Recipe.objects.update(
+            favourites_count=count_subquery(Favourite, 'recipe'),
+            in_carts_count=count_subquery(ShoppingCart, 'recipe'),
+        )
+        users = User.objects.update(
+            recipes_count=count_subquery(Recipe, 'author'),
+            followers_count=count_subquery(Subscription, 'author'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {recipes} recipes and {users} users'
+        ))
@@ -1,12 +1,19 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (Exists, F, OuterRef, Prefetch,
+                              UniqueConstraint, Value, Window)
+from django.db.models.functions import RowNumber
 
 from foodgram.settings import (COLOR_LENGTH, ING_LENGTH, MAX_COOK_TIME,
                                MIN_COOK_TIME, NAME_LENGTH, SLUG_LENGTH,
                                TAG_LENGTH, TEXT_LENGTH, UNIT_LENGTH)
+from users.models import CounterFieldsMixin, Subscription
+
+from .storage import media_storage
 
 User = get_user_model()
 
@@ -65,7 +72,70 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Recipe queryset with per-user annotations."""
+
+    def with_user_flags(self, user):
+        if user is None or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favourite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Return at most ``limit`` latest recipes of every author in a
+        single windowed query."""
+        if not author_ids:
+            # An empty IN list cannot be compiled into the raw query.
+            return self.none()
+        recipes = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return recipes
+        sql, params = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )).query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) AS ranked WHERE row_number <= %s '
+            f'ORDER BY author_id, row_number',
+            params + (limit,)
+        )
+
+    def for_read(self, user):
+        """Load everything RecipeGETSerializer renders in a fixed
+        number of queries."""
+        if user is None or user.is_anonymous:
+            authors = User.objects.annotate(
+                is_subscribed=Value(False, output_field=models.BooleanField())
+            )
+        else:
+            authors = User.objects.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author=OuterRef('pk')
+                ))
+            )
+        return self.with_user_flags(user).prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'ingredients_in_recipes',
+                queryset=IngredientAmount.objects.select_related('ingredient')
+            ),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Recipe model."""
     author = models.ForeignKey(
         User,
@@ -92,8 +162,24 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/',
+        storage=media_storage,
         verbose_name='Image',
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Image width',
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Image height',
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Image variants',
+    )
     text = models.CharField(
         max_length=TEXT_LENGTH,
         verbose_name='Text',
@@ -116,11 +202,40 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Date',
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Updated',
+    )
+    favourites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Added to favourites',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Added to shopping carts',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favourites_count', 'in_carts_count')
 
     class Meta:
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            GinIndex(
+                fields=('search_vector',), name='recipe_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -204,3 +319,90 @@ class ShoppingCart(models.Model):
         ]
         verbose_name = 'Shopping Cart'
         verbose_name_plural = 'Shopping Carts'
+
+
+class FeedEntry(models.Model):
+    """Recipe from a followed author, materialized into a user's feed."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='User',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Recipe',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Date',
+    )
+
+    class Meta:
+        ordering = ('-pub_date', '-recipe_id')
+        verbose_name = 'Feed entry'
+        verbose_name_plural = 'Feed entries'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx'
+            ),
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """Aggregated amount of an ingredient across a user's shopping cart."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='User',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ingredient',
+    )
+    amount = models.IntegerField(
+        verbose_name='quantity',
+    )
+
+    class Meta:
+        verbose_name = 'Shopping list item'
+        verbose_name_plural = 'Shopping list items'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.amount}'
+
+
+class MediaBlob(models.Model):
+    """Number of references to a content-addressed media file."""
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Name',
+    )
+    reference_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='References',
+    )
+
+    class Meta:
+        verbose_name = 'Media blob'
+        verbose_name_plural = 'Media blobs'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,127 @@
+from itertools import islice
+
+from django.db import connection
+from django.db.models import Sum
+
+from foodgram.settings import SHOPPING_LIST_BATCH_SIZE
+
+from .models import IngredientAmount, ShoppingCart, ShoppingListItem
+
+
+def apply_deltas(deltas):
+    """Add ``{(user_id, ingredient_id): delta}`` to the aggregated lists
+    with one upsert per batch, dropping rows that reach zero."""
+    rows = [
+        (user_id, ingredient_id, delta)
+        for (user_id, ingredient_id), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    table = connection.ops.quote_name(ShoppingListItem._meta.db_table)
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(islice(rows, SHOPPING_LIST_BATCH_SIZE))
+            if not batch:
+                break
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT (user_id, ingredient_id) '
+                f'DO UPDATE SET amount = {table}.amount + EXCLUDED.amount',
+                [value for row in batch for value in row]
+            )
+    ShoppingListItem.objects.filter(
+        user_id__in={user_id for user_id, _ in deltas}, amount__lte=0
+    ).delete()
+
+
+def apply_cart_change(user_id, recipe_ids, sign):
+    """Add (``sign=1``) or remove (``sign=-1``) recipes from a user's
+    aggregated list."""
+    amounts = IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id').annotate(total=Sum('amount')).order_by()
+    apply_deltas({
+        (user_id, row['ingredient_id']): sign * row['total']
+        for row in amounts
+    })
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(IngredientAmount.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def apply_recipe_change(recipe_id, before):
+    """Propagate a recipe's ingredient changes to every cart holding it.
+
+    ``before`` is the result of ``get_recipe_amounts`` taken before the
+    change.
+    """
+    after = get_recipe_amounts(recipe_id)
+    changes = {
+        ingredient_id: after.get(ingredient_id, 0) - before.get(
+            ingredient_id, 0)
+        for ingredient_id in before.keys() | after.keys()
+    }
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True)
+    apply_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in changes.items()
+    })
+
+
+def aggregate_from_carts():
+    """Shopping lists computed from scratch, as the download used to."""
+    return IngredientAmount.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    ).annotate(amount=Sum('amount')).order_by()
+
+
+def rebuild_shopping_lists():
+    ShoppingListItem.objects.all().delete()
+    rows = aggregate_from_carts().iterator(
+        chunk_size=SHOPPING_LIST_BATCH_SIZE
+    )
+    while True:
+        batch = list(islice(rows, SHOPPING_LIST_BATCH_SIZE))
+        if not batch:
+            break
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(
+                user_id=row['recipe__shopping_cart__user_id'],
+                ingredient_id=row['ingredient_id'],
+                amount=row['amount'],
+            ) for row in batch
+        ])
+
+
+def find_drift():
+    """Return (user_id, ingredient_id) pairs whose stored amount differs
+    from the amount computed from the carts."""
+    expected = {
+        (row['recipe__shopping_cart__user_id'], row['ingredient_id']):
+            row['amount']
+        for row in aggregate_from_carts().iterator()
+    }
+    stored = {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount
+        in ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).iterator()
+    }
+    return sorted(
+        key for key in expected.keys() | stored.keys()
+        if expected.get(key) != stored.get(key)
+    )
@@ -0,0 +1,119 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .links import change_counters
+from .feed import backfill_feed, fan_out_recipe, trim_feed
+from .images import get_stored_files, process_image, release_files
+from .models import Favourite, Ingredient, Recipe, ShoppingCart, Tag
+from .shopping_list import apply_cart_change
+from .snapshots import INGREDIENTS, TAGS, invalidate_catalog
+from users.models import Subscription
+
+User = get_user_model()
+
+log = logging.getLogger(__name__)
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def fan_out_saved_recipe(recipe):
+    # Runs after the commit, so a failure must not fail the request.
+    try:
+        fan_out_recipe(recipe)
+    except Exception:
+        log.exception('Could not add recipe %s to feeds', recipe.pk)
+
+
+@receiver(post_save, sender=Favourite)
+def favourite_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favourites_count', 1)
+
+
+@receiver(post_delete, sender=Favourite)
+def favourite_removed(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favourites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+        apply_cart_change(instance.user_id, [instance.recipe_id], 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_item_removing(sender, instance, **kwargs):
+    # Runs before a cascade from Recipe removes the ingredient amounts.
+    apply_cart_change(instance.user_id, [instance.recipe_id], -1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_item_removed(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(sender, instance, **kwargs):
+    # A freshly assigned upload is committed to storage by the save.
+    instance.image_uploaded = bool(instance.image) and (
+        not instance.image._committed
+    )
+    instance.replaced_files = []
+    if instance.image_uploaded:
+        if instance.pk:
+            instance.replaced_files = get_stored_files(instance.pk)
+        instance.image_width = instance.image_height = None
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        transaction.on_commit(lambda: fan_out_saved_recipe(instance))
+    if instance.image_uploaded:
+        recipe_id, name = instance.pk, instance.image.name
+        transaction.on_commit(lambda: process_image(recipe_id, name))
+    if instance.replaced_files:
+        replaced_files = instance.replaced_files
+        transaction.on_commit(lambda: release_files(replaced_files))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+    files = [instance.image.name, *instance.image_variants.values()]
+    transaction.on_commit(lambda: release_files(filter(None, files)))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    invalidate_catalog(INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    invalidate_catalog(TAGS)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+        backfill_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_removed(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'followers_count', -1)
+    trim_feed(instance.user_id, instance.author_id)
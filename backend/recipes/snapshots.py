@@ -0,0 +1,63 @@
+import threading
+from time import monotonic
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.settings import CATALOG_TTL
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+
+VERSION_KEY = 'catalog-version:{}'
+
+
+def get_catalog_version(catalog):
+    key = VERSION_KEY.format(catalog)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        return cache.get(key)
+    return version
+
+
+def invalidate_catalog(catalog):
+    key = VERSION_KEY.format(catalog)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CatalogSnapshot:
+    """Per-process value derived from a whole catalog.
+
+    The value is rebuilt when the catalog's shared version key changes
+    or after ``CATALOG_TTL`` seconds, which also covers per-process
+    caches that a management command cannot reach.
+    """
+    catalog = None
+
+    def __init__(self):
+        self.value = None
+        self.version = None
+        self.built_at = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = get_catalog_version(self.catalog)
+        if self.is_stale(version):
+            with self.lock:
+                if self.is_stale(version):
+                    self.value = self.build()
+                    self.version = version
+                    self.built_at = monotonic()
+        return self.value
+
+    def is_stale(self, version):
+        return (
+            self.built_at is None
+            or self.version != version
+            or monotonic() - self.built_at > CATALOG_TTL
+        )
+
+    def build(self):
+        raise NotImplementedError
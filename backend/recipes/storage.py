@@ -0,0 +1,127 @@
+import hashlib
+import os
+from tempfile import NamedTemporaryFile
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.utils.deconstruct import deconstructible
+
+from foodgram.settings import FILE_CHUNK_SIZE, MEDIA_SHARD_DEPTH
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming every file by its SHA-256.
+
+    Identical uploads share one file, sharded into nested directories
+    by the leading hash digits. ``MediaBlob`` counts the references to
+    each file and ``delete`` removes it once the last one is released.
+    Names stored before this scheme still open and delete as usual.
+    """
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(FILE_CHUNK_SIZE):
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        shards = [
+            hexdigest[index * 2:index * 2 + 2]
+            for index in range(MEDIA_SHARD_DEPTH)
+        ]
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join([
+            os.path.dirname(name), *shards, hexdigest + extension
+        ]).lstrip('/')
+
+    def get_available_name(self, name, max_length=None):
+        # A taken name holds the same bytes, so it is reused.
+        return name
+
+    def prepare(self, name, content):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return self.get_hashed_name(name, content), content
+
+    def write(self, name, content, max_length=None):
+        """Store the content without taking a reference to it."""
+        name, content = self.prepare(name, content)
+        return super().save(name, content, max_length)
+
+    def save(self, name, content, max_length=None):
+        name, content = self.prepare(name, content)
+        # Referenced before the existence check in _save: a concurrent
+        # delete_unreferenced either keeps the file or removes it first
+        # and the write below puts it back.
+        self.add_reference(name)
+        return super().save(name, content, max_length)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(
+                content.temporary_file_path(), full_path,
+                allow_overwrite=True,
+            )
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+            return name
+        # Concurrent writers of the same blob race harmlessly on the
+        # final rename since they write identical bytes.
+        with NamedTemporaryFile(dir=directory, delete=False) as temporary:
+            for chunk in content.chunks(FILE_CHUNK_SIZE):
+                temporary.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary.name, self.file_permissions_mode)
+        os.replace(temporary.name, full_path)
+        return name
+
+    def add_reference(self, name, count=1):
+        blob = apps.get_model('recipes', 'MediaBlob')
+        table = connection.ops.quote_name(blob._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (name, reference_count) '
+                f'VALUES (%s, %s) ON CONFLICT (name) DO UPDATE '
+                f'SET reference_count = {table}.reference_count + %s',
+                [name, count, count]
+            )
+
+    def delete(self, name):
+        """Release one reference and remove the file with the last one."""
+        blob = apps.get_model('recipes', 'MediaBlob')
+        with transaction.atomic():
+            blobs = blob.objects.select_for_update().filter(name=name)
+            current = blobs.values_list('reference_count', flat=True).first()
+            if current is not None and current > 1:
+                blobs.update(reference_count=current - 1)
+                return
+            blobs.delete()
+        transaction.on_commit(lambda: self.delete_unreferenced(name))
+
+    def delete_unreferenced(self, name):
+        """Remove the file unless something references it.
+
+        The upsert locks the blob row, even a missing one, so a
+        concurrent ``save`` of the same bytes waits for the unlink and
+        then writes the file again.
+        """
+        blob = apps.get_model('recipes', 'MediaBlob')
+        with transaction.atomic():
+            self.add_reference(name, 0)
+            unreferenced, _ = blob.objects.filter(
+                name=name, reference_count=0
+            ).delete()
+            if unreferenced:
+                super().delete(name)
+
+
+media_storage = ContentAddressedStorage()
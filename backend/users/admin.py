@@ -7,7 +7,8 @@ class UserAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'email',
         'username', 'first_name',
-        'last_name', 'password'
+        'last_name', 'password',
+        'recipes_count', 'followers_count'
     )
     search_fields = ('username', 'email')
     list_filter = ('username', 'email',)
@@ -6,7 +6,32 @@ from django.utils.translation import gettext_lazy as _
 from foodgram.settings import EMAIL_LENGTH
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """Keep denormalized counters out of saves of existing rows.
+
+    Counters only change through ``F()`` updates, so writing back the
+    values loaded with the instance would undo concurrent changes.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [
+                name for name in update_fields
+                if name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
         'username',
@@ -18,6 +43,18 @@ class User(AbstractUser):
         max_length=EMAIL_LENGTH,
         unique=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Recipes',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Followers',
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ['id']